@@ -3,11 +3,16 @@ import argparse
 import datetime
 import logging
 import os
+import re
+import time
 from datetime import datetime as dt
-from typing import Dict, Any, Optional
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+import numpy as np
+import orjson
+import niquests
+from lxml import etree
 
 # Configure logging
 logging.basicConfig(
@@ -21,73 +26,331 @@ from dotenv import load_dotenv
 load_dotenv()
 logging.info("Loaded environment variables from .env file")
 
+# Shared HTTP session so every call reuses pooled keep-alive connections;
+# niquests negotiates HTTP/2 with GitHub when available.
+# Transient server errors are retried with exponential backoff. Retrying a
+# POST is safe here: a duplicate commit object is never referenced because the
+# branch is only moved once the whole chain exists. Rate-limit responses
+# (403/429) are handled separately by _request().
+_SESSION: niquests.Session = niquests.Session(
+    retries=niquests.RetryConfiguration(
+        total=5,
+        backoff_factor=1.0,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods={"GET", "POST", "PATCH"},
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+)
+
+# Request bodies are encoded with orjson, so the content type is set explicitly.
+_JSON_HEADERS: Dict[str, str] = {"Content-Type": "application/json"}
+
+# Headers (the Authorization token, set from main) sent only to the REST API,
+# never to the public github.com contribution pages.
+_API_ROOT = "https://api.github.com/"
+_API_HEADERS: Dict[str, str] = {}
+
+# Rate-limit handling: how many times to retry a throttled request, and the
+# base delay (seconds) used for exponential backoff when GitHub gives no hint.
+_RATE_LIMIT_RETRIES = 5
+_RATE_LIMIT_BACKOFF = 2.0
+# GitHub asks clients to wait at least a minute on a secondary rate limit that
+# comes without a Retry-After header.
+_SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+
+def _rate_limit_delay(r: niquests.Response, attempt: int) -> Optional[float]:
+    """
+    Returns how long to wait before retrying a throttled response, or None if
+    the response was not rate limited. Honors "Retry-After" (secondary limits)
+    and "X-RateLimit-Reset" (primary limit exhausted). Any other 429, or a 403
+    whose body reports a secondary rate limit, waits at least a minute.
+    """
+    if r.status_code not in (403, 429):
+        return None
+    backoff = _RATE_LIMIT_BACKOFF * (2**attempt)
+    retry_after: Optional[str] = r.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), backoff)
+        except ValueError:
+            return backoff
+    if r.headers.get("X-RateLimit-Remaining") == "0":
+        reset: Optional[str] = r.headers.get("X-RateLimit-Reset")
+        if reset is not None:
+            try:
+                return max(float(reset) - time.time(), backoff)
+            except ValueError:
+                return backoff
+        return backoff
+    if r.status_code == 429 or b"secondary rate limit" in (r.content or b"").lower():
+        return max(backoff, _SECONDARY_RATE_LIMIT_WAIT)
+    return None
+
+
+def _request(method: str, url: str, **kwargs: Any) -> niquests.Response:
+    """
+    Sends a request through the shared session, sleeping and retrying while
+    GitHub reports that the request was rate limited. Requests to the REST API
+    carry the _API_HEADERS.
+    """
+    if url.startswith(_API_ROOT):
+        kwargs["headers"] = {**_API_HEADERS, **(kwargs.get("headers") or {})}
+    r: niquests.Response = _SESSION.request(method, url, **kwargs)
+    for attempt in range(_RATE_LIMIT_RETRIES):
+        delay: Optional[float] = _rate_limit_delay(r, attempt)
+        if delay is None:
+            break
+        logging.warning(
+            "Rate limited on %s %s (HTTP %s); retrying in %.1fs",
+            method,
+            url,
+            r.status_code,
+            delay,
+        )
+        time.sleep(delay)
+        r = _SESSION.request(method, url, **kwargs)
+    return r
+
+
 ### PART 1: Contributions Parsing ###
 
+# Contribution pages are cached by URL together with their ETag so unchanged
+# pages can be revalidated with a conditional GET instead of re-parsed.
+_CACHE_PATH: Path = Path.home() / ".cache" / "contribution_sync.json"
+
 
-def get_contributions(username: str, year: int) -> Dict[str, int]:
+def _load_cache() -> Dict[str, Any]:
     """
-    Get contributions for a given GitHub username and year.
-    Fetches the public contributions page and parses the HTML to return a
-    dictionary mapping date (YYYY-MM-DD) to contribution count (int).
+    Loads the contributions cache from disk, returning an empty cache if the
+    file is missing or unreadable.
+    """
+    try:
+        cache: Dict[str, Any] = orjson.loads(_CACHE_PATH.read_bytes())
+    except (OSError, ValueError):
+        return {"pages": {}}
+    if not isinstance(cache, dict):
+        return {"pages": {}}
+    if not isinstance(cache.get("pages"), dict):
+        cache["pages"] = {}
+    return cache
+
+
+def _save_cache(cache: Dict[str, Any]) -> None:
+    """
+    Writes the contributions cache to disk. Failures are logged and ignored
+    since the cache is only an optimization.
+    """
+    try:
+        _CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _CACHE_PATH.write_bytes(orjson.dumps(cache))
+    except OSError as e:
+        logging.warning("Could not write cache %s: %s", _CACHE_PATH, e)
 
-    This version looks for <td class="ContributionCalendar-day"> elements and
-    extracts the contribution level from the "data-level" attribute.
+
+# Fast path: scan the raw page for calendar cells instead of building a DOM.
+# Attribute order inside the <td> is not guaranteed, so the tag is matched
+# first and each attribute is pulled out of it separately.
+_DAY_CELL_RE = re.compile(rb"<td\b[^>]*\bContributionCalendar-day\b[^>]*>")
+_DATE_ATTR_RE = re.compile(rb'\bdata-date="(\d{4}-\d{2}-\d{2})"')
+_LEVEL_ATTR_RE = re.compile(rb'\bdata-level="(\d+)"')
+# A full calendar has 365+ cells; fewer means the markup probably changed.
+# Narrower windows are checked against their own length instead.
+_MIN_REGEX_DAYS = 300
+
+
+def _scan_contributions(content: bytes) -> Dict[str, int]:
+    """
+    Extracts date -> contribution level from the raw page bytes with regexes.
+    """
+    contributions: Dict[str, int] = {}
+    for cell in _DAY_CELL_RE.finditer(content):
+        tag: bytes = cell.group(0)
+        date = _DATE_ATTR_RE.search(tag)
+        level = _LEVEL_ATTR_RE.search(tag)
+        if date and level:
+            contributions[date.group(1).decode("ascii")] = int(level.group(1))
+    return contributions
+
+
+# The fallback parser is fed the page in chunks of this many bytes.
+_PARSE_CHUNK_SIZE = 64 * 1024
+
+
+def _parse_contributions(content: bytes) -> Dict[str, int]:
+    """
+    Extracts date -> contribution level by parsing the page HTML.
+    The raw bytes are fed to a pull parser in chunks and every element is
+    discarded once its end tag has been read, so the partial tree only holds
+    the current chunk's elements and their open ancestors, never the full DOM.
+    """
+    parser = etree.HTMLPullParser(events=("end",))
+    contributions: Dict[str, int] = {}
+
+    def drain() -> None:
+        for _, elem in parser.read_events():
+            # Calendar cells are <td class="ContributionCalendar-day" ...> tags.
+            if (
+                elem.tag == "td"
+                and "ContributionCalendar-day" in (elem.get("class") or "").split()
+            ):
+                date: Optional[str] = elem.get("data-date")
+                count: Optional[str] = elem.get("data-level")
+                if date and count:
+                    try:
+                        contributions[date] = int(count)
+                    except ValueError:
+                        contributions[date] = 0
+            # The element and everything before it at this level are finished.
+            elem.clear()
+            # The root has no parent but may still follow a top-level comment.
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+    try:
+        for offset in range(0, len(content), _PARSE_CHUNK_SIZE):
+            parser.feed(content[offset : offset + _PARSE_CHUNK_SIZE])
+            drain()
+        parser.close()
+        drain()
+    except (etree.ParserError, etree.XMLSyntaxError) as e:
+        # Unparseable (e.g. empty) bodies yield whatever was read so far.
+        logging.warning("Could not parse contributions page: %s", e)
+    return contributions
+
+
+# Contributions are held as one slot per day of the year, indexed by the
+# number of days since January 1st (366 slots so leap years fit).
+_CALENDAR_DAYS = 366
+
+
+def _day_index(year: int, day: str) -> int:
+    """
+    Returns the calendar slot for a YYYY-MM-DD date in the given year.
+    """
+    return (datetime.date.fromisoformat(day) - datetime.date(year, 1, 1)).days
+
+
+def _index_day(year: int, index: int) -> str:
+    """
+    Returns the YYYY-MM-DD date for a calendar slot in the given year.
+    """
+    return (datetime.date(year, 1, 1) + datetime.timedelta(days=int(index))).isoformat()
+
+
+def _to_calendar(contributions: Dict[str, int], year: int) -> np.ndarray:
+    """
+    Packs a date -> level mapping into a day-of-year array, dropping any
+    dates that fall outside the year.
     """
-    from_date = f"{year}-01-01"
-    to_date = f"{year}-12-31"
+    calendar: np.ndarray = np.zeros(_CALENDAR_DAYS, dtype=np.int8)
+    # Slot 365 only exists in leap years; otherwise it would be next January 1st.
+    year_days: int = (datetime.date(year + 1, 1, 1) - datetime.date(year, 1, 1)).days
+    for day, count in contributions.items():
+        index: int = _day_index(year, day)
+        if 0 <= index < year_days:
+            calendar[index] = count
+    return calendar
+
+
+def _fetch_contributions(
+    username: str,
+    year: int,
+    cache: Dict[str, Any],
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> Tuple[np.ndarray, Optional[str], bool]:
+    """
+    Does the work for get_contributions and additionally returns the page's
+    ETag and whether the page changed since it was cached (False on a 304).
+    The page entry is looked up in, and written back to, the given cache.
+    """
+    from_date = from_date or f"{year}-01-01"
+    to_date = to_date or f"{year}-12-31"
     url = f"https://github.com/users/{username}/contributions?from={from_date}&to={to_date}"
     logging.info("Fetching contributions from URL: %s", url)
-    r: requests.Response = requests.get(url)
+    cached: Optional[Dict[str, Any]] = cache["pages"].get(url)
+    headers: Dict[str, str] = {}
+    if cached and cached.get("etag") and "calendar" in cached:
+        headers["If-None-Match"] = cached["etag"]
+    r: niquests.Response = _request("GET", url, headers=headers)
+    if r.status_code == 304 and cached:
+        logging.info("Contributions for %s not modified; using cache", username)
+        return np.array(cached["calendar"], dtype=np.int8), cached["etag"], False
     if r.status_code != 200:
         logging.error(
             "Failed to fetch contributions for %s: HTTP %s", username, r.status_code
         )
         r.raise_for_status()
-    html: str = r.text
-    soup: BeautifulSoup = BeautifulSoup(html, "html.parser")
-    contributions: Dict[str, int] = {}
-    # The contributions page contains many <td class="ContributionCalendar-day" ...> tags.
-    for td in soup.find_all("td", {"class": "ContributionCalendar-day"}):
-        date: Optional[str] = td.get("data-date")
-        count: Optional[str] = td.get("data-level")
-        if date and count:
-            try:
-                contributions[date] = int(count)
-            except ValueError:
-                contributions[date] = 0
+    window_days: int = (
+        dt.strptime(to_date, "%Y-%m-%d") - dt.strptime(from_date, "%Y-%m-%d")
+    ).days + 1
+    contributions: Dict[str, int] = _scan_contributions(r.content)
+    if len(contributions) < min(_MIN_REGEX_DAYS, window_days):
+        logging.warning(
+            "Regex scan found only %d days for %s; falling back to HTML parser",
+            len(contributions),
+            username,
+        )
+        contributions = _parse_contributions(r.content)
     logging.info("Parsed %d days of contributions for %s", len(contributions), username)
-    return contributions
+    calendar: np.ndarray = _to_calendar(contributions, year)
+    etag: Optional[str] = r.headers.get("ETag")
+    if etag:
+        cache["pages"][url] = {"etag": etag, "calendar": calendar.tolist()}
+        _save_cache(cache)
+    return calendar, etag, True
+
+
+def get_contributions(
+    username: str,
+    year: int,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Get contributions for a given GitHub username and year.
+    The window defaults to the whole year and can be narrowed with from_date /
+    to_date (YYYY-MM-DD) to shrink the page that has to be downloaded.
+    Fetches the public contributions page and parses the HTML to return an
+    int8 array of contribution counts indexed by day of the year (see
+    _day_index / _index_day).
 
+    This version looks for <td class="ContributionCalendar-day"> elements and
+    extracts the contribution level from the "data-level" attribute. A regex
+    scan over the raw bytes is tried first; the HTML parser is only used if
+    the scan finds fewer cells than a full calendar should have.
 
-### PART 2: GitHub API Helpers ###
+    The page is requested with the ETag from the previous run; if GitHub answers
+    304 Not Modified the cached result is returned without parsing.
+    """
+    calendar, _, _ = _fetch_contributions(
+        username, year, _load_cache(), from_date, to_date
+    )
+    return calendar
 
 
-def get_latest_commit(owner: str, repo: str, branch: str, token: str) -> str:
-    """
-    Retrieves the latest commit SHA on the given branch using the GitHub API.
-    """
-    url = f"https://api.github.com/repos/{owner}/{repo}/git/ref/heads/{branch}"
-    headers = {"Authorization": f"token {token}"}
-    r: requests.Response = requests.get(url, headers=headers)
-    r.raise_for_status()
-    data: Dict[str, Any] = r.json()
-    commit_sha: str = data["object"]["sha"]
-    logging.info("Latest commit on %s/%s is %s", repo, branch, commit_sha)
-    return commit_sha
+### PART 2: GitHub API Helpers ###
 
 
-def get_commit_tree(owner: str, repo: str, commit_sha: str, token: str) -> str:
+def get_latest_commit(owner: str, repo: str, branch: str) -> Tuple[str, str]:
     """
-    Retrieves the tree SHA for a given commit.
+    Retrieves the latest commit SHA on the given branch and its tree SHA using
+    a single GitHub API call.
     """
-    url = f"https://api.github.com/repos/{owner}/{repo}/git/commits/{commit_sha}"
-    headers = {"Authorization": f"token {token}"}
-    r: requests.Response = requests.get(url, headers=headers)
+    url = f"https://api.github.com/repos/{owner}/{repo}/commits/{branch}"
+    r: niquests.Response = _request("GET", url)
     r.raise_for_status()
-    data: Dict[str, Any] = r.json()
-    tree_sha: str = data["tree"]["sha"]
-    logging.info("Tree for commit %s is %s", commit_sha, tree_sha)
-    return tree_sha
+    data: Dict[str, Any] = orjson.loads(r.content)
+    commit_sha: str = data["sha"]
+    tree_sha: str = data["commit"]["tree"]["sha"]
+    logging.info(
+        "Latest commit on %s/%s is %s (tree %s)", repo, branch, commit_sha, tree_sha
+    )
+    return commit_sha, tree_sha
 
 
 def create_commit(
@@ -96,42 +359,43 @@ def create_commit(
     message: str,
     tree_sha: str,
     parent_sha: str,
-    commit_date: str,
-    author_name: str,
-    author_email: str,
-    token: str,
+    signature: Dict[str, str],
 ) -> str:
     """
     Creates a new commit (with no file changes) using the GitHub API.
-    The commit uses the same tree as the parent commit to be an 'empty commit',
-    and sets the commit date in the author and committer details.
+    The commit uses the same tree as the parent commit to be an 'empty commit'.
+    The signature ({"name", "email", "date"}) is used as both author and
+    committer, so callers can build it once and reuse it for every commit
+    on the same day.
     Returns the new commit's SHA.
     """
     url = f"https://api.github.com/repos/{owner}/{repo}/git/commits"
-    headers = {"Authorization": f"token {token}"}
     payload: Dict[str, Any] = {
         "message": message,
         "tree": tree_sha,
         "parents": [parent_sha],
-        "author": {"name": author_name, "email": author_email, "date": commit_date},
-        "committer": {"name": author_name, "email": author_email, "date": commit_date},
+        "author": signature,
+        "committer": signature,
     }
-    r: requests.Response = requests.post(url, json=payload, headers=headers)
+    r: niquests.Response = _request(
+        "POST", url, data=orjson.dumps(payload), headers=_JSON_HEADERS
+    )
     r.raise_for_status()
-    data: Dict[str, Any] = r.json()
+    data: Dict[str, Any] = orjson.loads(r.content)
     new_sha: str = data["sha"]
-    logging.info("Created new commit: %s", new_sha)
+    logging.debug("Created new commit: %s", new_sha)
     return new_sha
 
 
-def update_ref(owner: str, repo: str, branch: str, new_sha: str, token: str) -> None:
+def update_ref(owner: str, repo: str, branch: str, new_sha: str) -> None:
     """
     Updates the branch reference to point to the new commit SHA.
     """
     url = f"https://api.github.com/repos/{owner}/{repo}/git/refs/heads/{branch}"
-    headers = {"Authorization": f"token {token}"}
     payload: Dict[str, Any] = {"sha": new_sha, "force": False}
-    r: requests.Response = requests.patch(url, json=payload, headers=headers)
+    r: niquests.Response = _request(
+        "PATCH", url, data=orjson.dumps(payload), headers=_JSON_HEADERS
+    )
     r.raise_for_status()
     logging.info("Updated branch %s to new commit %s", branch, new_sha)
 
@@ -139,62 +403,59 @@ def update_ref(owner: str, repo: str, branch: str, new_sha: str, token: str) ->
 ### PART 3: Diff Calculation and Commit Creation ###
 
 
-def calculate_diff(
-    work_contrib: Dict[str, int], current_contrib: Dict[str, int]
-) -> Dict[str, int]:
+def calculate_diff(work_contrib: np.ndarray, current_contrib: np.ndarray) -> np.ndarray:
     """
     Calculate the difference in contributions for each day.
-    Returns a dictionary mapping date to the number of additional commits required
+    Returns a day-of-year array with the number of additional commits required
     (i.e. diff = work contributions - current contributions, or 0 if current is greater).
     """
-    diff: Dict[str, int] = {}
-    for day, work_count in work_contrib.items():
-        current_count = current_contrib.get(day, 0)
-        extra = work_count - current_count
-        diff[day] = extra if extra > 0 else 0
-    total_missing = sum(diff.values())
+    diff: np.ndarray = np.maximum(work_contrib - current_contrib, 0)
+    total_missing = int(diff.sum())
     logging.info("Total additional commits needed: %d", total_missing)
     return diff
 
 
 def update_contributions(
-    diff: Dict[str, int],
+    diff: np.ndarray,
+    year: int,
     owner: str,
     repo: str,
     branch: str,
-    token: str,
     author_name: str,
     author_email: str,
 ) -> None:
     """
     For each day with missing commits, create the required number of empty commits
     (via the GitHub API) so that the contributions graph will match.
-    Commits are created in chronological order.
-    """
-    current_sha: str = get_latest_commit(owner, repo, branch, token)
-    tree_sha: str = get_commit_tree(owner, repo, current_sha, token)
-    for day in sorted(diff.keys()):
-        missing: int = diff[day]
-        if missing <= 0:
-            continue
+    Commits are created in chronological order as a single chain, and the branch
+    is moved to the tip of that chain once all commits exist.
+    """
+    # Empty commits all share the tree of the starting commit.
+    current_sha, tree_sha = get_latest_commit(owner, repo, branch)
+    for index in np.flatnonzero(diff):
+        day: str = _index_day(year, index)
+        missing: int = int(diff[index])
         commit_date: str = f"{day}T12:00:00Z"  # Fixed time; adjust as needed.
+        signature: Dict[str, str] = {
+            "name": author_name,
+            "email": author_email,
+            "date": commit_date,
+        }
         for i in range(missing):
             message: str = f"Sync commit for {day} ({i+1}/{missing})"
-            logging.info("Creating commit for %s: %s", day, message)
+            logging.debug("Creating commit for %s: %s", day, message)
             new_sha: str = create_commit(
                 owner,
                 repo,
                 message,
                 tree_sha,
                 current_sha,
-                commit_date,
-                author_name,
-                author_email,
-                token,
+                signature,
             )
-            update_ref(owner, repo, branch, new_sha, token)
             current_sha = new_sha  # Next commit will have this as parent.
-            logging.info("Created commit %s for date %s", new_sha, day)
+            logging.debug("Created commit %s for date %s", new_sha, day)
+        logging.info("Created %d commits for %s", missing, day)
+    update_ref(owner, repo, branch, current_sha)
 
 
 ### PART 4: Main Function ###
@@ -246,17 +507,51 @@ def main() -> None:
     if not author_email:
         author_email = f"{current_username}@users.noreply.github.com"
 
+    _API_HEADERS["Authorization"] = f"token {token}"
+
     logging.info(
         "Fetching contributions for work account: %s (%s)", work_username, year
     )
-    work_contrib: Dict[str, int] = get_contributions(work_username, year)
+    # The cache is read once and shared by both page fetches and the no-op check.
+    cache: Dict[str, Any] = _load_cache()
+    work_contrib, work_etag, work_changed = _fetch_contributions(
+        work_username, year, cache
+    )
+    # Only days with work contributions can need commits, so the current account
+    # is fetched for the window spanning the first to last active work day.
+    active_days: np.ndarray = np.flatnonzero(work_contrib)
+    if active_days.size == 0:
+        logging.info("No work contributions in %s; nothing to sync.", year)
+        return
+    first_day: str = _index_day(year, active_days[0])
+    last_day: str = _index_day(year, active_days[-1])
     logging.info(
-        "Fetching contributions for current account: %s (%s)", current_username, year
+        "Fetching contributions for current account: %s (%s to %s)",
+        current_username,
+        first_day,
+        last_day,
+    )
+    current_contrib, current_etag, current_changed = _fetch_contributions(
+        current_username, year, cache, from_date=first_day, to_date=last_day
     )
-    current_contrib: Dict[str, int] = get_contributions(current_username, year)
 
-    diff: Dict[str, int] = calculate_diff(work_contrib, current_contrib)
-    if sum(diff.values()) == 0:
+    # If neither page changed since a run that found nothing to do, there is
+    # still nothing to do.
+    last_sync: Dict[str, Any] = {
+        "work_etag": work_etag,
+        "current_etag": current_etag,
+        "total_missing": 0,
+    }
+    if not work_changed and not current_changed and cache.get("last_sync") == last_sync:
+        logging.info("Contribution pages unchanged since last sync; no-op.")
+        return
+
+    diff: np.ndarray = calculate_diff(work_contrib, current_contrib)
+    if work_etag and current_etag:
+        last_sync["total_missing"] = int(diff.sum())
+        cache["last_sync"] = last_sync
+        _save_cache(cache)
+    if not diff.any():
         logging.info("No additional commits are required; contributions already match.")
         return
 
@@ -266,7 +561,7 @@ def main() -> None:
     owner, repo = parts[0], parts[1]
     logging.info("Updating contributions on %s/%s, branch %s", owner, repo, dest_branch)
     update_contributions(
-        diff, owner, repo, dest_branch, token, author_name, author_email
+        diff, year, owner, repo, dest_branch, author_name, author_email
     )
 
 